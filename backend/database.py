@@ -1,17 +1,92 @@
 import sqlite3
+import threading
 from typing import List, Optional, Tuple, Dict, Any
 import json
 from datetime import datetime
 
+# One long-lived connection per thread, so SQLite's page cache and statement
+# cache survive across calls instead of being thrown away on every close().
+_local = threading.local()
+
+# Cached result of get_arg_column(); the schema only changes in init_db()
+_ARG_COL: Optional[str] = None
+
+# Stored in PRAGMA user_version; bump whenever init_db() gains a migration step.
+#   2: script_args.used_at and the lookup indexes
+#   3: unique (reference, args, working_dir) index that save_script_args upserts on
+SCHEMA_VERSION = 3
+
+# Process-local caches for the script list and categories; scripts change
+# rarely, so every mutating helper simply drops them.
+_cache_lock = threading.Lock()
+_SCRIPTS_CACHE: Optional[List[Dict[str, Any]]] = None
+_CATS_CACHE: Optional[List[str]] = None
+
+def _invalidate_caches():
+    global _SCRIPTS_CACHE, _CATS_CACHE
+    with _cache_lock:
+        _SCRIPTS_CACHE = None
+        _CATS_CACHE = None
+
 def get_db_connection():
-    conn = sqlite3.connect('scripts.db')
+    conn = sqlite3.connect('scripts.db', cached_statements=256)
     conn.row_factory = sqlite3.Row
+    # Per-connection tuning; journal_mode=WAL is persistent and set in init_db()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-65536')  # 64 MiB
+    conn.execute('PRAGMA mmap_size=268435456')  # 256 MiB
+    conn.execute('PRAGMA busy_timeout=3000')
     return conn
 
+def acquire_connection() -> sqlite3.Connection:
+    """Borrow this thread's connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = get_db_connection()
+    return conn
+
+def release_connection(conn: sqlite3.Connection):
+    """Hand a borrowed connection back, rolling back anything left uncommitted."""
+    if conn.in_transaction:
+        conn.rollback()
+
+def close_connection():
+    """Close this thread's connection; the next acquire reopens it."""
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    _local.cursors = {}
+    if conn is not None:
+        conn.close()
+
+def q(conn: sqlite3.Connection, sql: str, params=()) -> sqlite3.Cursor:
+    """Execute *sql* on a cursor kept per SQL text, so its prepared statement is reused."""
+    cursors = getattr(_local, 'cursors', None)
+    if cursors is None:
+        cursors = _local.cursors = {}
+    cur = cursors.get(sql)
+    if cur is None or cur.connection is not conn:
+        cur = cursors[sql] = conn.cursor()
+    return cur.execute(sql, params)
+
 def init_db():
     """Initialize the database with required tables."""
-    conn = get_db_connection()
+    global _ARG_COL
+    # Migrations below may change script_args, so re-probe its columns afterwards
+    _ARG_COL = None
+    _invalidate_caches()
+    # Start from a fresh connection so re-initialising picks up the current target
+    close_connection()
+    conn = acquire_connection()
     try:
+        # WAL is stored in the database file, so it only needs to be set once
+        conn.execute('PRAGMA journal_mode=WAL')
+
+        # Hot start: the schema is already current, skip the migration probes
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
         # Check if scripts table exists
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='scripts'")
         if cursor.fetchone() is None:
@@ -67,40 +142,70 @@ def init_db():
         columns = [column[1] for column in cursor.fetchall()]
         if 'working_dir' not in columns:
             conn.execute('ALTER TABLE script_args ADD COLUMN working_dir TEXT')
-        
+        if 'used_at' not in columns:
+            conn.execute('ALTER TABLE script_args ADD COLUMN used_at TIMESTAMP')
+
+        # Index the "latest args for a script" lookup so it needs no scan or sort
+        if 'script_id' in columns or 'script_name' not in columns:
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_script_args_ref_time ON script_args(script_id, used_at DESC)')
+        if 'script_name' in columns:
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_script_args_name_time ON script_args(script_name, used_at DESC)')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_scripts_name ON scripts(name)')
+
+        # save_script_args upserts on (reference, args, working_dir); older
+        # databases carry that as a table constraint, fresh ones need the index
+        ref_col = _probe_arg_column(conn)
+        if not _has_unique_index(conn, 'script_args', (ref_col, 'args', 'working_dir')):
+            # Drop rows that would violate it, keeping the most recently used
+            conn.execute(f'''
+                DELETE FROM script_args WHERE id IN (
+                    SELECT a.id FROM script_args a JOIN script_args b
+                    ON b.{ref_col} = a.{ref_col} AND b.args = a.args AND b.working_dir = a.working_dir
+                    AND (IFNULL(b.used_at, '') > IFNULL(a.used_at, '')
+                         OR (IFNULL(b.used_at, '') = IFNULL(a.used_at, '') AND b.id > a.id))
+                )
+            ''')
+            conn.execute(f'CREATE UNIQUE INDEX idx_script_args_unique ON script_args({ref_col}, args, working_dir)')
+
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
     except Exception as e:
         print(f"Error initializing database: {e}")
         raise
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_all_scripts() -> List[Dict[str, Any]]:
     """Get all scripts with their name and description."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute('SELECT id, name, description, accepts_reference, category FROM scripts ORDER BY category, name')
-        return [dict(row) for row in cursor.fetchall()]
-    finally:
-        conn.close()
+    global _SCRIPTS_CACHE
+    with _cache_lock:
+        if _SCRIPTS_CACHE is not None:
+            return _SCRIPTS_CACHE
+        conn = acquire_connection()
+        try:
+            cursor = conn.execute('SELECT id, name, description, accepts_reference, category FROM scripts ORDER BY category, name')
+            _SCRIPTS_CACHE = [dict(row) for row in cursor.fetchall()]
+            return _SCRIPTS_CACHE
+        finally:
+            release_connection(conn)
 
 def get_script_by_name(name: str) -> Optional[Dict[str, Any]]:
     """Get a specific script by name (trims whitespace)."""
     name = name.strip()
-    conn = get_db_connection()
+    conn = acquire_connection()
     try:
-        cursor = conn.execute('SELECT * FROM scripts WHERE name = ?', (name,))
+        cursor = q(conn, 'SELECT * FROM scripts WHERE name = ?', (name,))
         row = cursor.fetchone()
         return dict(row) if row else None
     finally:
-        conn.close()
+        release_connection(conn)
 
 def save_script(name: str, description: str, body: str, accepts_reference:bool = False, category: str = 'Uncategorized') -> bool:
     """Save or update a script in the database."""
     name = name.strip()
-    conn = get_db_connection()
+    conn = acquire_connection()
     try:
-        conn.execute('''
+        q(conn, '''
         INSERT INTO scripts (name, description, accepts_reference, body, category)
         VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(name) DO UPDATE SET
@@ -110,72 +215,80 @@ def save_script(name: str, description: str, body: str, accepts_reference:bool =
             category = excluded.category
         ''', (name, description, accepts_reference, body, category))
         conn.commit()
+        _invalidate_caches()
         return True
     except Exception as e:
         print(f"Error saving script: {e}")
         return False
     finally:
-        conn.close()
+        release_connection(conn)
 
 def delete_script(name: str) -> bool:
     """Delete a script by name."""
     name = name.strip()
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = acquire_connection()
     try:
-        c.execute('DELETE FROM scripts WHERE name = ?', (name,))
+        q(conn, 'DELETE FROM scripts WHERE name = ?', (name,))
         conn.commit()
+        _invalidate_caches()
         return True
     except sqlite3.Error:
         return False
     finally:
-        conn.close()
+        release_connection(conn)
 
 def save_script_args(script_name: str, args: str, working_dir:str=None) -> bool:
     """Save script arguments and working directory, keeping only the last 10."""
     script_name = script_name.strip()
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = acquire_connection()
     try:
-        # Get script id
-        c.execute('SELECT id FROM scripts WHERE name = ?', (script_name,))
-        script = c.fetchone()
-        if not script:
-            return False
-        
+        # One write transaction for the upsert and the trim, so the WAL is synced once
+        conn.execute('BEGIN IMMEDIATE')
+
         col = get_arg_column(conn)
 
-        # Prepare value for reference column
-        ref_value = script['id'] if col == 'script_id' else script_name
+        # Value stored in the reference column, resolved from scripts inline
+        ref_expr = 'id' if col == 'script_id' else 'name'
 
-        # Insert new args
-        c.execute(f"INSERT OR IGNORE INTO script_args ({col}, args, working_dir) VALUES (?, ?, ?);", (ref_value, args, working_dir))
         current_timestamp = datetime.utcnow().isoformat()
-        # Delete old args keeping only last 10
-        c.execute(f'''
+        # Insert new args, or bump used_at if this combination was seen before.
+        # The script lookup is folded into the INSERT, so an unknown name inserts nothing.
+        cursor = q(conn, f'''
             INSERT INTO script_args ({col}, args, working_dir, used_at)
-            VALUES (?, ?, ?, ?)
+            SELECT {ref_expr}, ?, ?, ? FROM scripts WHERE name = ?
             ON CONFLICT({col}, args, working_dir) DO UPDATE SET
                 used_at = excluded.used_at,
                 working_dir = excluded.working_dir;
-        ''', (ref_value, args, working_dir, current_timestamp))
+        ''', (args, working_dir, current_timestamp, script_name))
+        if cursor.rowcount == 0:
+            return False
+
+        # Keep only the 10 most recent entries for this script
+        q(conn, f'''
+            DELETE FROM script_args
+            WHERE {col} = (SELECT {ref_expr} FROM scripts WHERE name = ?) AND id NOT IN (
+                SELECT id FROM script_args
+                WHERE {col} = (SELECT {ref_expr} FROM scripts WHERE name = ?)
+                ORDER BY used_at DESC
+                LIMIT 10
+            )
+        ''', (script_name, script_name))
         
         conn.commit()
         return True
     except sqlite3.Error as e:
         return False
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_script_args(script_name: str) -> List[str]:
     """Get the last 10 arguments and working directory used for a script."""
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = acquire_connection()
     try:
         col = get_arg_column(conn)
         if col == 'script_id':
             # look up id
-            id_cursor = c.execute('SELECT id FROM scripts WHERE name = ?', (script_name,))
+            id_cursor = q(conn, 'SELECT id FROM scripts WHERE name = ?', (script_name,))
             id_row = id_cursor.fetchone()
             if not id_row:
                 return []
@@ -183,13 +296,13 @@ def get_script_args(script_name: str) -> List[str]:
         else:
             ref_value = script_name
 
-        c.execute(f'''
+        cursor = q(conn, f'''
             SELECT args, working_dir FROM script_args 
             WHERE {col} = ?
             ORDER BY used_at DESC
             LIMIT 10
         ''', (ref_value,))
-        args = [{'args': row['args'], 'working_dir': row['working_dir']} for row in c.fetchall()]
+        args = [{'args': row['args'], 'working_dir': row['working_dir']} for row in cursor.fetchall()]
         return args
     except sqlite3.OperationalError as e:
         # Gracefully handle missing column (legacy DB)
@@ -197,19 +310,21 @@ def get_script_args(script_name: str) -> List[str]:
             return []
         raise
     finally:
-        conn.close()
+        release_connection(conn)
 
 def get_categories() -> List[str]:
     """Get all unique categories."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute('SELECT DISTINCT category FROM scripts ORDER BY category')
-        return [row['category'] for row in cursor.fetchall()]
-    finally:
-        conn.close()
-
-# Initialize database when module is imported
-init_db()
+    global _CATS_CACHE
+    with _cache_lock:
+        if _CATS_CACHE is not None:
+            return _CATS_CACHE
+        conn = acquire_connection()
+        try:
+            cursor = conn.execute('SELECT DISTINCT category FROM scripts ORDER BY category')
+            _CATS_CACHE = [row['category'] for row in cursor.fetchall()]
+            return _CATS_CACHE
+        finally:
+            release_connection(conn)
 
 # New function to rename a script and optionally update its metadata
 def rename_script(old_name: str, new_name: str, description: str, body: str, accepts_reference:bool = False, category: str = 'Uncategorized') -> bool:
@@ -220,7 +335,8 @@ def rename_script(old_name: str, new_name: str, description: str, body: str, acc
     Returns True on success, False otherwise (e.g., new_name already exists)."""
     old_name = old_name.strip()
     new_name = new_name.strip()
-    conn = get_db_connection()
+    conn = acquire_connection()
+    fk_enabled = None
     try:
         # Ensure the new name is unique (excluding the current row)
         cursor = conn.execute('SELECT id FROM scripts WHERE name = ?', (new_name,))
@@ -233,7 +349,11 @@ def rename_script(old_name: str, new_name: str, description: str, body: str, acc
                 return False
 
         # Temporarily disable FK constraints so we can update the PK column
+        # (this pragma is a no-op inside a transaction, so it brackets BEGIN/COMMIT).
+        # The connection is shared by later calls, so remember what to restore.
+        fk_enabled = conn.execute('PRAGMA foreign_keys').fetchone()[0]
         conn.execute('PRAGMA foreign_keys = OFF')
+        conn.execute('BEGIN IMMEDIATE')
 
         # Update the scripts row in-place (keeps the same id)
         conn.execute(
@@ -250,26 +370,45 @@ def rename_script(old_name: str, new_name: str, description: str, body: str, acc
             )
         # if 'script_id', no update necessary
 
-        # Re-enable FK constraints
-        conn.execute('PRAGMA foreign_keys = ON')
-
         conn.commit()
+        _invalidate_caches()
         return True
     except Exception as e:
         print(f"Error renaming script from {old_name} to {new_name}: {e}")
         return False
     finally:
-        conn.close()
+        release_connection(conn)
+        # Put FK enforcement back the way this thread's connection had it
+        if fk_enabled is not None:
+            conn.execute(f'PRAGMA foreign_keys = {"ON" if fk_enabled else "OFF"}')
 
 # Utility ------------------------------------------------------------
+def _has_unique_index(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...]) -> bool:
+    """Whether *table* has a UNIQUE index (or constraint) on exactly *columns*."""
+    for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        if not index['unique']:
+            continue
+        info = conn.execute(f"PRAGMA index_info('{index['name']}')").fetchall()
+        if tuple(row['name'] for row in info) == columns:
+            return True
+    return False
+
 def get_arg_column(conn: sqlite3.Connection) -> str:
     """Return the column name in *script_args* that stores the script name.
 
     Modern schema uses *script_name*, legacy uses *name*. We inspect PRAGMA
     table_info(script_args) and return whichever exists. Defaults to
-    'script_name' if table doesn't exist (callers will create it)."""
+    'script_name' if table doesn't exist (callers will create it).
+
+    The probe runs once per init_db(); later calls return the cached name."""
+    global _ARG_COL
+    if _ARG_COL is None:
+        _ARG_COL = _probe_arg_column(conn)
+    return _ARG_COL
+
+def _probe_arg_column(conn: sqlite3.Connection) -> str:
     try:
-        cur = conn.execute("PRAGMA table_info(script_args)")
+        cur = q(conn, "PRAGMA table_info(script_args)")
         cols = [row[1] for row in cur.fetchall()]
         if 'script_id' in cols:
             return 'script_id'
@@ -1,4 +1,8 @@
+import orjson
+
 class ExecResult:
+    __slots__ = ('type', 'command', 'args', 'json_result', 'text_result')
+
     def __init__(self, type:str, command: str, json_result: str, text_result: str, args=None):
         self.type = type
         self.command = command
@@ -7,26 +11,27 @@ class ExecResult:
         self.text_result = text_result
 
 class ExecEnv:
+    __slots__ = ('_result', '_reference')
+
     def __init__(self):
-        self._results = []   # List to store results
+        self._result = None   # Only the most recent result is kept
+        self._reference = None   # Encoded --reference value for _result, built on first use
 
     def add_result(self, result: ExecResult):
-        self._results=[result]
+        self._result = result
+        self._reference = None
 
     def get_text(self):
-        if len(self._results) > 0:
-            return self._results[0].text_result
-        else:
-            return ""
+        return self._result.text_result if self._result else ""
 
     def get_json(self):
-        if len(self._results) > 0:
-            return self._results[0].json_result
-        else:
-            return {}
+        return self._result.json_result if self._result else {}
 
     def get_results(self):
-        if len(self._results) > 0:
-            return self._results[0].json_result
-        else:
-            return []
\ No newline at end of file
+        return self._result.json_result if self._result else []
+
+    def get_reference(self):
+        """Hex-encoded JSON of the latest result, as passed to scripts via --reference"""
+        if self._reference is None:
+            self._reference = orjson.dumps(self.get_json(), option=orjson.OPT_NON_STR_KEYS).hex()
+        return self._reference
@@ -2,10 +2,16 @@ import argparse
 import json
 import sys
 import os
-from flask import Flask, send_from_directory, render_template_string, request, jsonify
+import re
+import functools
+import hashlib
+import mimetypes
+import tempfile
+import time
+from flask import Flask, Response, abort, request, jsonify
+from werkzeug.security import safe_join
+from werkzeug.wsgi import FileWrapper
 from threading import Thread
-import webview
-from PIL import Image, ExifTags
 import socket
 
 app = Flask(__name__)
@@ -15,6 +21,12 @@ rel_paths = []
 index = 0
 show_exif = False
 
+THUMB_SIZE = (300, 300)
+THUMB_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "imviewer")
+# Bounds enforced by prune_thumb_cache() each time a viewer starts
+THUMB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+THUMB_CACHE_MAX_AGE = 30 * 24 * 3600
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
@@ -65,7 +77,7 @@ HTML_TEMPLATE = """
         </script>
         <div class="grid">
             {% for img in images %}
-                <a href="/?image={{ loop.index0 }}"><img src="/image/{{ img }}" class="thumbnail"></a>
+                <a href="/?image={{ loop.index0 }}"><img src="/thumb/{{ img }}" class="thumbnail"></a>
             {% endfor %}
         </div>
     {% endif %}
@@ -124,13 +136,15 @@ document.location.href = "/";}
 </html>
 """
 
+# Compiled once; render_template_string would re-parse the template per request
+_TPL = app.jinja_env.from_string(HTML_TEMPLATE)
+
 
-def find_free_port(start=5000, max_tries=100):
-    for port in range(start, start + max_tries):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            if s.connect_ex(('localhost', port)) != 0:
-                return port
-    raise RuntimeError("No free port found")
+def find_free_port():
+    # Let the OS pick an unused port instead of probing candidates one by one
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
 
 
 @app.route("/close")
@@ -146,57 +160,189 @@ def close():
 def home():
     global index
     image = request.args.get("image")
-    print("Image:", image)
+    app.logger.debug("Image: %s", image)
     if image:
         try:
             index = int(image)
         except:
             index = 0
-        print("Sending image:", index, "of", len(rel_paths))
-        print("path:", rel_paths[index])
-        return render_template_string(HTML_TEMPLATE, image=rel_paths[index], images=[])
-    return render_template_string(HTML_TEMPLATE, image=None, images=rel_paths)
+        app.logger.debug("Sending image: %s of %s (%s)", index, len(rel_paths), rel_paths[index])
+        return _TPL.render(image=rel_paths[index], images=[])
+    return _TPL.render(image=None, images=rel_paths)
+
+
+def send_image(filename, cache_control):
+    """Serve *filename* from base_dir through the server's ``wsgi.file_wrapper``.
+
+    Servers that implement the wrapper hand the descriptor to sendfile(2), so
+    the bytes never pass through Python; otherwise werkzeug's FileWrapper
+    streams the file in 64 KiB blocks. ETag/Last-Modified and Range handling
+    match send_from_directory(conditional=True)."""
+    path = safe_join(base_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_path(path, cache_control)
+
+
+def send_path(path, cache_control):
+    """Stream the file at *path*; see send_image()."""
+    st = os.stat(path)
+    wrapper = request.environ.get("wsgi.file_wrapper", FileWrapper)
+    response = Response(
+        wrapper(open(path, "rb"), 65536),
+        mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        direct_passthrough=True,
+    )
+    response.content_length = st.st_size
+    response.last_modified = st.st_mtime
+    response.set_etag(f"{st.st_mtime}-{st.st_size}")
+    response.headers["Cache-Control"] = cache_control
+    return response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
 
 
 @app.route("/image")
 def serve_current_image():
     global index
     filename = rel_paths[index]
-    return send_from_directory(base_dir, filename)
+    # The URL is shared by every image, so only allow revalidation (ETag -> 304)
+    return send_image(filename, "no-cache")
 
 
 @app.route("/image/<path:filename>")
 def serve_image(filename):
-    print(filename)
-    return send_from_directory(base_dir, filename)
+    app.logger.debug("Serving %s", filename)
+    return send_image(filename, "public, max-age=3600")
+
+
+def make_thumbnail(path):
+    """Return the cached JPEG thumbnail for *path*, generating it on first use.
+
+    Returns None if an earlier attempt on this version of the file failed.
+    The cache key includes the source mtime, so edited images get a new thumbnail
+    (and a fresh attempt)."""
+    from PIL import Image, ImageOps
+
+    st = os.stat(path)
+    key = hashlib.sha1(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()
+    thumb_path = os.path.join(THUMB_CACHE_DIR, key + ".jpg")
+    if os.path.exists(thumb_path):
+        return thumb_path
+    fail_path = os.path.join(THUMB_CACHE_DIR, key + ".fail")
+    if os.path.exists(fail_path):
+        return None
+    os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+    # A unique temp file per call: the threaded server can build the same
+    # thumbnail from several requests at once
+    fd, tmp_path = tempfile.mkstemp(dir=THUMB_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(THUMB_SIZE)
+            img.convert("RGB").save(out, "JPEG", quality=85)
+        # Publish atomically so a concurrent request never serves a partial file
+        os.replace(tmp_path, thumb_path)
+    except BaseException as e:
+        os.unlink(tmp_path)
+        if isinstance(e, Exception):
+            # Leave an empty marker so later requests skip PIL for this file
+            try:
+                open(fail_path, "wb").close()
+            except OSError:
+                pass
+        raise
+    return thumb_path
+
+
+def prune_thumb_cache():
+    """Trim THUMB_CACHE_DIR to THUMB_CACHE_MAX_AGE and THUMB_CACHE_MAX_BYTES.
+
+    Entries past the age limit go first, then the oldest of the rest until the
+    cache fits. Failure markers age out too, so failed images are retried
+    eventually. Temp files more than an hour old are leftovers of a crashed build."""
+    now = time.time()
+    entries = []
+    try:
+        it = os.scandir(THUMB_CACHE_DIR)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            name = entry.name
+            if not name.endswith((".jpg", ".fail", ".tmp")):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            age = now - st.st_mtime
+            if age > (3600 if name.endswith(".tmp") else THUMB_CACHE_MAX_AGE):
+                _remove_quietly(entry.path)
+            elif not name.endswith(".tmp"):
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    if total > THUMB_CACHE_MAX_BYTES:
+        entries.sort()
+        for _, size, path in entries:
+            if total <= THUMB_CACHE_MAX_BYTES:
+                break
+            _remove_quietly(path)
+            total -= size
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@app.route("/thumb/<path:filename>")
+def serve_thumbnail(filename):
+    path = safe_join(base_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    try:
+        thumb_path = make_thumbnail(path)
+    except Exception as e:
+        # Logged once: make_thumbnail records the failure for later requests
+        app.logger.warning("Thumbnail failed for %s: %s", path, e)
+        thumb_path = None
+    if thumb_path is None:
+        return send_path(path, "public, max-age=3600")
+    return send_path(thumb_path, "public, max-age=3600")
 
 
 @app.route("/nav/<direction>")
 def navigate(direction):
-    print("Navigating:", direction, "Total images:", len(rel_paths))
+    app.logger.debug("Navigating: %s, total images: %s", direction, len(rel_paths))
     global index
     if direction == "next":
         index = (index + 1) % len(rel_paths)
     elif direction == "prev":
         index = (index - 1) % len(rel_paths)
-    print("New index:", index)
-    print("Image path:", rel_paths[index])
-    return render_template_string(HTML_TEMPLATE, image=rel_paths[index], images=[])
+    app.logger.debug("New index: %s (%s)", index, rel_paths[index])
+    # The page only swaps mainImage.src after this call, so skip re-rendering HTML
+    return jsonify(index=index, path=rel_paths[index])
 
 
-@app.route("/exif")
-def exif():
-    full_path = os.path.join(base_dir, rel_paths[index])
-    try:
-        img = Image.open(full_path)
+@functools.lru_cache(maxsize=128)
+def _exif_for(path, mtime):
+    """Return the EXIF summary text for *path*; *mtime* keys the cache so edits are picked up."""
+    from PIL import Image, ExifTags
+
+    with Image.open(path) as img:
         exif_data = img._getexif()
         if exif_data:
             exif = {ExifTags.TAGS.get(k, k): str(v) for k, v in exif_data.items()}
-            print(jsonify(exif="\n".join([f"{k}: {v}" for k, v in exif.items()])))
+            return "\n".join([f"{k}: {v}" for k, v in exif.items()])
+        return f"Width: {img.width}\nHeight: {img.height}"
+
 
-            return jsonify(exif="\n".join([f"{k}: {v}" for k, v in exif.items()]))
-        else:
-            return jsonify(exif=f"Width: {img.width}\nHeight: {img.height}")
+@app.route("/exif")
+def exif():
+    full_path = os.path.join(base_dir, rel_paths[index])
+    try:
+        return jsonify(exif=_exif_for(full_path, os.path.getmtime(full_path)))
     except Exception as e:
         return jsonify(exif=f"Error reading EXIF: {e}")
 
@@ -213,6 +359,9 @@ window = None
 
 
 def start_image_viewer(bdir, paths):
+    # webview pulls in a GUI toolkit; only pay for it when a viewer is opened
+    import webview
+
     global base_dir, rel_paths, index, window
     base_dir = bdir
     rel_paths = paths
@@ -227,6 +376,8 @@ def start_image_viewer(bdir, paths):
         app.run(port=port, debug=False, use_reloader=False)
 
     Thread(target=run_server, daemon=True).start()
+    # Off the startup path; the cache is only read by thumbnail requests
+    Thread(target=prune_thumb_cache, daemon=True).start()
     window = webview.create_window("Image Viewer", url)
     webview.start()
 
@@ -240,16 +391,31 @@ def decode_reference(hex_str):
         sys.exit(1)
 
 
+_PART_RE = re.compile(r'(\d+)\s*(?:-\s*(\d+))?')
+
+
 def parse_number_arg(number_arg):
-    result = set()
+    """Turn a 1-based spec like "1-3,7" into sorted, de-duplicated 0-based indexes.
+
+    Ranges are merged as (start, end) spans rather than expanded into a set,
+    so a spec like "1-100000" never hashes or re-sorts every index."""
+    spans = []
     for part in number_arg.split(','):
-        part = part.strip()
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            result.update(range(start - 1, end))
-        else:
-            result.add(int(part) - 1)
-    return sorted(result)
+        m = _PART_RE.fullmatch(part.strip())
+        if m is None:
+            raise ValueError(f"Invalid number: {part.strip()!r}")
+        start, end = m.groups()
+        spans.append((int(start) - 1, int(end or start)))
+    spans.sort()
+    result = []
+    covered = None  # exclusive end of the indexes emitted so far
+    for start, end in spans:
+        if covered is not None:
+            start = max(start, covered)
+        if start < end:
+            result.extend(range(start, end))
+            covered = end
+    return result
 
 
 def display_image(base_dir, rel_paths):
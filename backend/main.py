@@ -1,27 +1,48 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import re
+import logging
+import fnmatch
+import codecs
 import shutil
-from typing import List, Dict, Optional, Any
+import tempfile
+from typing import List, Dict, Optional, Any, Callable
 from pathlib import Path
-import json
+from contextlib import asynccontextmanager
+from itertools import count, repeat
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import yaml
 import subprocess
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, TypeAdapter
+import secrets
 import signal
 import psutil
 import shlex
 from sse_starlette.sse import EventSourceResponse
 import asyncio
-import threading
-import queue
-from fastapi.responses import StreamingResponse
+import math
+import anyio
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 import database
 from exec_env import ExecEnv, ExecResult
 
-app = FastAPI()
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Done at startup rather than on import so importing the module stays cheap
+    database.init_db()
+    yield
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+logger = logging.getLogger(__name__)
 exec_env = ExecEnv()
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,7 +53,9 @@ app.add_middleware(
 )
 
 # Store running processes
-running_processes: Dict[str, subprocess.Popen] = {}
+running_processes: Dict[str, asyncio.subprocess.Process] = {}
+# Sequence for command IDs; a random suffix keeps them distinct across restarts
+command_seq = count()
 
 # Store saved commands
 SAVED_COMMANDS_FILE = "saved_commands.json"
@@ -47,6 +70,8 @@ class SavedCommand(BaseModel):
     sortDirection: Optional[str] = None
     postProcess: Optional[Dict[str, str]] = None
 
+saved_commands_adapter = TypeAdapter(Dict[str, SavedCommand])
+
 class Script(BaseModel):
     name: str
     description: str
@@ -60,43 +85,40 @@ class ScriptExecution(BaseModel):
     args: Optional[str] = None
     working_dir: Optional[str] = None
 
+class ScriptConcurrency(BaseModel):
+    limit: int
+
 def load_saved_commands() -> Dict[str, SavedCommand]:
     try:
         if os.path.exists(SAVED_COMMANDS_FILE):
-            with open(SAVED_COMMANDS_FILE, 'r') as f:
-                data = json.load(f)
-                return {name: SavedCommand(**cmd) for name, cmd in data.items()}
+            # Parse and validate in one pass inside pydantic-core
+            return saved_commands_adapter.validate_json(Path(SAVED_COMMANDS_FILE).read_bytes())
     except Exception as e:
-        print(f"Error loading saved commands: {e}")
+        logger.error("Error loading saved commands: %s", e)
     return {}
 
 def save_commands(commands: Dict[str, SavedCommand]):
+    global saved_commands_json
     try:
-        with open(SAVED_COMMANDS_FILE, 'w') as f:
-            json.dump({name: cmd.dict() for name, cmd in commands.items()}, f, indent=2)
+        data = orjson.dumps(saved_commands_adapter.dump_python(commands), option=orjson.OPT_INDENT_2)
+        # The file contents double as the GET /api/fs/saved-commands body
+        saved_commands_json = data
+        # Write a sibling temp file and swap it in so readers never see a partial file
+        tmp_path = SAVED_COMMANDS_FILE + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SAVED_COMMANDS_FILE)
     except Exception as e:
-        print(f"Error saving commands: {e}")
+        logger.error("Error saving commands: %s", e)
 
 # Load saved commands at startup
 saved_commands = load_saved_commands()
+# Serialized saved_commands, built on first GET and replaced by save_commands()
+saved_commands_json: Optional[bytes] = None
 
 class FileManager:
-    @staticmethod
-    def validate_path(path: str) -> Optional[str]:
-        """Validate path and return error message if invalid."""
-        if not path or path == "/":
-            return None
-            
-        # Check if path exists
-        if not os.path.exists(path):
-            return f"Path does not exist: {path}"
-            
-        # Check if path is accessible
-        if not os.access(path, os.R_OK):
-            return f"Path is not accessible: {path}"
-            
-        return None
-
     @staticmethod
     def list_directory(path: str) -> Dict:
         try:
@@ -104,26 +126,31 @@ class FileManager:
             if not path or path == "/":
                 path = "."
             
-            # Validate path
-            error = FileManager.validate_path(path)
-            if error:
+            # Opening the directory doubles as validation, so there is no
+            # separate exists/access round-trip before it
+            try:
+                it = os.scandir(path)
+            except (FileNotFoundError, PermissionError) as e:
                 return {
                     "items": [],
-                    "error": error,
+                    "error": (f"Path does not exist: {path}" if isinstance(e, FileNotFoundError)
+                              else f"Path is not accessible: {path}"),
                     "is_valid": False
                 }
-                
+
             items = []
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                stats = os.stat(full_path)
-                items.append({
-                    "name": item,
-                    "path": full_path,
-                    "is_dir": os.path.isdir(full_path),
-                    "size": stats.st_size,
-                    "modified": stats.st_mtime
-                })
+            append = items.append  # bound once for the per-entry loop
+            # scandir's DirEntry caches the file type and stat, saving syscalls per entry
+            with it:
+                for entry in it:
+                    stats = entry.stat()
+                    append({
+                        "name": entry.name,
+                        "path": entry.path,
+                        "is_dir": entry.is_dir(),
+                        "size": stats.st_size,
+                        "modified": stats.st_mtime
+                    })
             return {
                 "items": items,
                 "error": None,
@@ -163,21 +190,73 @@ class FileManager:
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @staticmethod
+    def _match_entry(entry: os.DirEntry) -> Dict:
+        stats = entry.stat(follow_symlinks=False)
+        return {
+            "name": entry.name,
+            "path": entry.path,
+            "size": stats.st_size,
+            "modified": stats.st_mtime
+        }
+
+    @staticmethod
+    def _name_matcher(pattern: str) -> Callable[[str], Any]:
+        # Glob patterns match the whole name; anything else is a substring search.
+        # Both ignore case.
+        if any(c in pattern for c in '*?['):
+            return re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        needle = pattern.casefold()
+        return lambda name: needle in name.casefold()
+
+    @staticmethod
+    def _search_tree(root: str, matches: Callable[[str], Any]) -> List[Dict]:
+        results = []
+        # Depth-first walk over scandir so each DirEntry's cached type/stat is reused
+        stack = [root]
+        # Local names for the per-entry loop
+        scandir, push, pop = os.scandir, stack.append, stack.pop
+        append, match_entry = results.append, FileManager._match_entry
+        while stack:
+            try:
+                it = scandir(pop())
+            except OSError:
+                # Unreadable directories are skipped, as os.walk did
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir():
+                        # Like os.walk, don't descend into symlinked directories
+                        if not entry.is_symlink():
+                            push(entry.path)
+                    elif matches(entry.name):
+                        append(match_entry(entry))
+        return results
+
     @staticmethod
     def search_files(directory: str, pattern: str) -> List[Dict]:
         try:
+            matches = FileManager._name_matcher(pattern)
             results = []
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if pattern.lower() in file.lower():
-                        full_path = os.path.join(root, file)
-                        stats = os.stat(full_path)
-                        results.append({
-                            "name": file,
-                            "path": full_path,
-                            "size": stats.st_size,
-                            "modified": stats.st_mtime
-                        })
+            subdirs = []
+            try:
+                it = os.scandir(directory)
+            except OSError:
+                return results
+            with it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif matches(entry.name):
+                        results.append(FileManager._match_entry(entry))
+
+            # scandir/stat release the GIL, so top-level subtrees are walked in parallel
+            if subdirs:
+                workers = min(32, (os.cpu_count() or 1) * 4, len(subdirs))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for subtree in pool.map(FileManager._search_tree, subdirs, repeat(matches)):
+                        results.extend(subtree)
             return results
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -191,46 +270,94 @@ class CommandRequest(BaseModel):
     postProcess: Optional[Dict[str, str]] = None
     debug: Optional[bool] = False
 
-def parse_size(size_str: str) -> int:
+# df columns whose values are sorted numerically rather than as text
+NUMERIC_SORT_FIELDS = frozenset({'size', 'used', 'avail', 'use%'})
+
+# Multiplier for the (upper-cased) trailing character of a df size; '%' keeps the number as is
+SIZE_SCALE = {'K': 1024.0, 'M': 1024.0**2, 'G': 1024.0**3, 'T': 1024.0**4, 'P': 1024.0**5, '%': 1.0}
+
+def parse_size(size_str: str) -> float:
     """Convert human-readable size to bytes"""
-    if not size_str:
-        return 0
     size_str = size_str.strip()
+    if not size_str:
+        return 0.0
     try:
-        # Handle percentage values
-        if '%' in size_str:
-            return float(size_str.replace('%', ''))
-        # Handle human-readable sizes
-        units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
-        if size_str[-1] in units:
-            return float(size_str[:-1]) * units[size_str[-1]]
+        # Handle human-readable sizes and percentages
+        scale = SIZE_SCALE.get(size_str[-1].upper())
+        if scale is not None:
+            return float(size_str[:-1]) * scale
         # Handle plain numbers
         return float(size_str)
     except ValueError:
-        # If parsing fails, return the original string for comparison
-        return size_str
+        # Unparseable values (e.g. '-') sort below every real size and keep keys comparable
+        return float('-inf')
+
+# Characters that only mean something to a shell (pipes, redirects, substitutions)
+SHELL_META_RE = re.compile(r'[|&;<>()$`]')
+
+def needs_shell(command: str) -> bool:
+    """Whether a post-process command must run under bash rather than be exec'd"""
+    return command.lstrip().startswith('awk') or SHELL_META_RE.search(command) is not None
+
+# Argument builders for the commands /api/fs/command may run, keyed by command name
+def build_df_args(options: Optional[Dict[str, bool]], parameters: Optional[Dict[str, str]]) -> List[str]:
+    # df doesn't need path parameter
+    return ['-h'] if options and options.get('human', True) else []
+
+def build_du_args(options: Optional[Dict[str, bool]], parameters: Optional[Dict[str, str]]) -> List[str]:
+    args = []
+    if options:
+        if options.get('human', True):
+            args.append('-h')
+        if options.get('maxdepth', True):
+            args.extend(('--max-depth', '1'))
+    if parameters:
+        if 'path' in parameters:
+            args.append(parameters['path'])
+        if 'depth' in parameters:
+            args.extend(('--max-depth', parameters['depth']))
+    return args
+
+def build_find_args(options: Optional[Dict[str, bool]], parameters: Optional[Dict[str, str]]) -> List[str]:
+    args = []
+    if parameters:
+        if 'path' in parameters:
+            args.append(parameters['path'])
+        if 'name' in parameters:
+            args.extend(('-name', parameters['name']))
+        if 'type' in parameters:
+            args.extend(('-type', parameters['type']))
+    return args
+
+COMMAND_BUILDERS = {
+    'df': build_df_args,
+    'du': build_du_args,
+    'find': build_find_args,
+}
 
 # API Routes
+# The FileManager routes are plain functions so FastAPI runs them in its
+# threadpool; scandir/rmtree and friends would otherwise block the event loop.
 @app.get("/api/files/list/{path:path}")
-async def list_directory(path: str):
+def list_directory(path: str):
     return FileManager.list_directory(path)
 
 
 
 @app.post("/api/files/create-dir/{path:path}")
-async def create_directory(path: str):
+def create_directory(path: str):
     return FileManager.create_directory(path)
 
 @app.delete("/api/files/delete/{path:path}")
-async def delete_path(path: str):
+def delete_path(path: str):
     return FileManager.delete_path(path)
 
 @app.post("/api/files/rename")
-async def rename_path(old_path: str, new_path: str):
+def rename_path(old_path: str, new_path: str):
     return FileManager.rename_path(old_path, new_path)
 
 @app.get("/api/files/search")
-async def search_files(directory: str, pattern: str):
+def search_files(directory: str, pattern: str):
     return FileManager.search_files(directory, pattern)
 
 @app.post("/api/fs/command")
@@ -239,70 +366,42 @@ async def execute_fs_command(request: CommandRequest):
         if not request.command:
             raise HTTPException(status_code=400, detail="Command is required")
 
+        builder = COMMAND_BUILDERS.get(request.command)
+        if builder is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported command: {request.command}")
+
         # Generate a unique ID for this command
-        command_id = f"{request.command}_{datetime.now().timestamp()}"
+        command_id = f"{request.command}_{next(command_seq):x}_{secrets.token_hex(3)}"
 
         # Build command arguments
-        args = [request.command]
-        
-        # Add options
-        if request.options:
-            if request.command == 'df' and request.options.get('human', True):
-                args.append('-h')
-            elif request.command == 'du':
-                if request.options.get('human', True):
-                    args.append('-h')
-                if request.options.get('maxdepth', True):
-                    args.append('--max-depth')
-                    args.append('1')
-        
-        # Add parameters
-        if request.parameters:
-            if request.command == 'df':
-                # df doesn't need path parameter
-                pass
-            elif request.command == 'du':
-                if 'path' in request.parameters:
-                    args.append(request.parameters['path'])
-                if 'depth' in request.parameters:
-                    args.append('--max-depth')
-                    args.append(request.parameters['depth'])
-            elif request.command == 'find':
-                if 'path' in request.parameters:
-                    args.append(request.parameters['path'])
-                if 'name' in request.parameters:
-                    args.append('-name')
-                    args.append(request.parameters['name'])
-                if 'type' in request.parameters:
-                    args.append('-type')
-                    args.append(request.parameters['type'])
+        args = [request.command, *builder(request.options, request.parameters)]
 
         # Print the full command being executed
         full_command = ' '.join(args)
-        print(f"\nExecuting command: {full_command}")
+        logger.debug("Executing command: %s", full_command)
         if request.postProcess:
-            print(f"Post-processing: {request.postProcess}")
+            logger.debug("Post-processing: %s", request.postProcess)
 
         # Execute command with process group
-        process = subprocess.Popen(
-            args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            preexec_fn=os.setsid  # Create new process group
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True  # Create new process group
         )
         
         # Store the process
         running_processes[command_id] = process
 
         try:
-            # Wait for the process to complete
-            stdout, stderr = process.communicate()
+            # Wait for the process to complete without blocking the event loop
+            stdout_bytes, stderr_bytes = await process.communicate()
+            stdout = stdout_bytes.decode()
+            stderr = stderr_bytes.decode()
             
             if process.returncode != 0:
                 error_detail = stderr.strip() if stderr else "Command failed with no error message"
-                print(f"Command failed with return code {process.returncode}")
-                print(f"Error: {error_detail}")
+                logger.warning("Command failed with return code %s: %s", process.returncode, error_detail)
                 raise HTTPException(
                     status_code=500,
                     detail={
@@ -319,7 +418,7 @@ async def execute_fs_command(request: CommandRequest):
             # Handle sorting for df command
             if request.command == 'df' and request.sortField:
                 try:
-                    lines = output.strip().split('\n')
+                    lines = output.splitlines()
                     if len(lines) > 1:
                         header = lines[0]
                         data_lines = lines[1:]
@@ -329,27 +428,26 @@ async def execute_fs_command(request: CommandRequest):
                         sort_index = header_parts.index(request.sortField) if request.sortField in header_parts else None
                         
                         if sort_index is not None:
-                            # Parse and sort data lines
-                            parsed_lines = []
+                            # Extract the sort column once; size columns become floats
+                            numeric = request.sortField.lower() in NUMERIC_SORT_FIELDS
+                            rows = []
+                            values = []
                             for line in data_lines:
                                 parts = line.split()
                                 if len(parts) > sort_index:
                                     value = parts[sort_index]
-                                    # Convert human-readable sizes to bytes for sorting
-                                    if request.sortField in ['size', 'used', 'avail']:
-                                        value = parse_size(value)
-                                    elif request.sortField == 'use%':
-                                        value = float(value.rstrip('%'))
-                                    parsed_lines.append((value, line))
-                            
-                            # Sort based on direction
+                                    values.append(parse_size(value) if numeric else value)
+                                    rows.append(line)
+
+                            # Sort row indices by the extracted values
                             reverse = request.sortDirection == 'desc'
-                            parsed_lines.sort(key=lambda x: x[0], reverse=reverse)
-                            
+                            order = sorted(range(len(rows)), key=values.__getitem__, reverse=reverse)
+
                             # Reconstruct output
-                            output = header + '\n' + '\n'.join(line for _, line in parsed_lines)
+                            output = header + '\n' + '\n'.join([rows[i] for i in order])
 
                             if request.debug:
+                                parsed_lines = [(values[i], rows[i]) for i in order]
                                 debug_info = {
                                     'header': header,
                                     'header_length': len(header),
@@ -361,7 +459,7 @@ async def execute_fs_command(request: CommandRequest):
                                     'post_process': request.postProcess
                                 }
                 except Exception as e:
-                    print(f"Error processing df output: {str(e)}")
+                    logger.error("Error processing df output: %s", e)
                     raise HTTPException(
                         status_code=500,
                         detail={
@@ -376,49 +474,32 @@ async def execute_fs_command(request: CommandRequest):
                 for proc_name, proc_args in request.postProcess.items():
                     if proc_args:
                         try:
-                            # For complex commands like awk, we need to handle them differently
-                            if proc_args.strip().startswith('awk'):
-                                # Create a shell script to execute the awk command
-                                script_content = f"""#!/bin/bash
-{proc_args}
-"""
-                                # Write the script to a temporary file
-                                script_path = f"/tmp/process_{command_id}.sh"
-                                with open(script_path, 'w') as f:
-                                    f.write(script_content)
-                                os.chmod(script_path, 0o755)  # Make it executable
-                                
-                                print(f"Executing post-processing script: {script_path}")
-                                print(f"Script content: {script_content}")
-                                
-                                # Execute the script
-                                proc_process = subprocess.Popen(
-                                    [script_path],
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    text=True
-                                )
+                            # awk programs and pipelines need the shell to parse them; anything
+                            # else is split like a shell would and executed directly
+                            if needs_shell(proc_args):
+                                logger.debug("Executing post-processing script: %s", proc_args)
+                                proc_parts = ['/bin/bash', '-c', proc_args]
                             else:
-                                # For simpler commands, split and execute directly
-                                proc_parts = proc_args.split()
-                                if proc_parts:
-                                    print(f"Executing post-processing: {proc_args}")
-                                    proc_process = subprocess.Popen(
-                                        proc_parts,
-                                        stdin=subprocess.PIPE,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        text=True
-                                    )
-                            
+                                logger.debug("Executing post-processing: %s", proc_args)
+                                proc_parts = shlex.split(proc_args)
+                            if not proc_parts:
+                                continue
+                            proc_process = await asyncio.create_subprocess_exec(
+                                *proc_parts,
+                                stdin=asyncio.subprocess.PIPE,
+                                stdout=asyncio.subprocess.PIPE,
+                                stderr=asyncio.subprocess.PIPE
+                            )
+
                             # Pipe the output through the post-processing command
-                            proc_stdout, proc_stderr = proc_process.communicate(input=output)
+                            proc_stdout, proc_stderr = await proc_process.communicate(input=output.encode())
+                            proc_stdout = proc_stdout.decode()
+                            proc_stderr = proc_stderr.decode()
                             
                             if proc_process.returncode == 0:
                                 output = proc_stdout
                             else:
-                                print(f"Post-processing failed: {proc_stderr.strip()}")
+                                logger.warning("Post-processing failed: %s", proc_stderr.strip())
                                 raise HTTPException(
                                     status_code=500,
                                     detail={
@@ -427,16 +508,9 @@ async def execute_fs_command(request: CommandRequest):
                                         "command": proc_args
                                     }
                                 )
-                            
-                            # Clean up the temporary script if it was created
-                            if proc_args.strip().startswith('awk'):
-                                try:
-                                    os.remove(script_path)
-                                except:
-                                    pass
-                                    
+
                         except Exception as e:
-                            print(f"Error in post-processing: {str(e)}")
+                            logger.error("Error in post-processing: %s", e)
                             raise HTTPException(
                                 status_code=500,
                                 detail={
@@ -454,13 +528,18 @@ async def execute_fs_command(request: CommandRequest):
 
         finally:
             # Remove the process from tracking
-            if command_id in running_processes:
-                del running_processes[command_id]
+            running_processes.pop(command_id, None)
+            # If the handler is cancelled mid-run (e.g. on shutdown), do not leave the command running
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
 
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -486,8 +565,8 @@ async def cancel_command(command_id: str):
         
         # Wait a bit for the process to terminate
         try:
-            process.wait(timeout=1)
-        except subprocess.TimeoutExpired:
+            await asyncio.wait_for(process.wait(), timeout=1)
+        except asyncio.TimeoutError:
             # If it's still running, force kill
             try:
                 os.killpg(os.getpgid(process.pid), signal.SIGKILL)
@@ -495,7 +574,7 @@ async def cancel_command(command_id: str):
                 pass
         
         # Remove from tracking
-        del running_processes[command_id]
+        running_processes.pop(command_id, None)
         
         return {"status": "cancelled"}
         
@@ -504,7 +583,10 @@ async def cancel_command(command_id: str):
 
 @app.get("/api/fs/saved-commands")
 async def get_saved_commands():
-    return {name: cmd.dict() for name, cmd in saved_commands.items()}
+    global saved_commands_json
+    if saved_commands_json is None:
+        saved_commands_json = orjson.dumps(saved_commands_adapter.dump_python(saved_commands))
+    return Response(content=saved_commands_json, media_type="application/json")
 
 @app.post("/api/fs/save-command")
 async def save_command(command: SavedCommand):
@@ -555,6 +637,8 @@ async def get_script(name: str):
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
         return script
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -565,7 +649,7 @@ async def get_script_args(name: str):
         args = database.get_script_args(name)
         return {"args": args}
     except Exception as e:
-        print(f"Error getting script args: {e}")
+        logger.error("Error getting script args: %s", e)
         return {"args": []}
 
 @app.post("/api/fs/save-script")
@@ -585,6 +669,8 @@ async def delete_script(name: str):
         if database.delete_script(name):
             return {"message": "Script deleted successfully"}
         raise HTTPException(status_code=404, detail="Script not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -620,309 +706,282 @@ async def rename_script_endpoint(payload: Dict[str, Any]):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in rename_script_endpoint: {e}")
+        logger.error("Error in rename_script_endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-def stream_process_output(process, output_queue):
-    """Stream process output to a queue"""
-    def read_output(pipe, is_error=False):
-        try:
-            while True:
-                line = pipe.readline()
-                if not line and process.poll() is not None:
-                    break
-                if line:
-                    output_queue.put(('error' if is_error else 'output', line.strip()))
-        except Exception as e:
-            print(f"Error reading {'stderr' if is_error else 'stdout'}: {str(e)}")
-    
-    # Create threads to read stdout and stderr
-    stdout_thread = threading.Thread(target=read_output, args=(process.stdout, False))
-    stderr_thread = threading.Thread(target=read_output, args=(process.stderr, True))
-    
-    stdout_thread.daemon = True
-    stderr_thread.daemon = True
-    
-    stdout_thread.start()
-    stderr_thread.start()
-    
-    # Wait for both threads to complete
-    stdout_thread.join()
-    stderr_thread.join()
-    
-    # Wait for process to complete
-    process.wait()
-    
-    # Read any remaining output
-    for line in process.stdout:
-        if line:
-            output_queue.put(('output', line.strip()))
-    for line in process.stderr:
-        if line:
-            output_queue.put(('error', line.strip()))
-    
-    output_queue.put(('done', None))
-
-@app.post("/api/fs/execute-script-stream")
-async def execute_script_stream(script: ScriptExecution, request: Request):
+# SSE frames are built as bytes so Starlette sends them without re-encoding
+SSE_EVENT_NAMES = {"output": b"output", "error": b"error"}
+SSE_DONE_FRAME = b"event: done\ndata: Script execution completed\n\n"
+
+def _build_sse_frame(event_type: str, data: str) -> bytes:
+    """Encode one SSE frame, escaping newlines so the data stays on one line"""
+    name = SSE_EVENT_NAMES.get(event_type) or event_type.encode()
+    return b"".join((b"event: ", name, b"\ndata: ", data.replace("\n", "\\n").encode(), b"\n\n"))
+
+# Opening of a Python script body, after any leading whitespace
+PYTHON_HEAD_RE = re.compile(r'\s*(?:#!/usr/bin/env python|#!/usr/bin/python|import |from )')
+
+def _is_python(body: str, name_py: bool) -> bool:
+    """Guess whether a script body is Python from its name or opening line"""
+    # match() stops at the first mismatch, so the body is neither copied nor scanned in full
+    return name_py or PYTHON_HEAD_RE.match(body) is not None
+
+# How many streamed script runs may execute at once; later requests wait for a
+# slot. Adjustable at runtime through /api/fs/script-concurrency.
+MAX_CONCURRENT_SCRIPTS = 16
+script_limiter: Optional[anyio.CapacityLimiter] = None
+
+def get_script_limiter() -> anyio.CapacityLimiter:
+    """Return the script limiter, creating it on first use inside the event loop"""
+    global script_limiter
+    if script_limiter is None:
+        script_limiter = anyio.CapacityLimiter(MAX_CONCURRENT_SCRIPTS)
+    return script_limiter
+
+# Linux limit on the length of one argv string, including its NUL (32 pages)
+MAX_ARG_STRLEN = 32 * 4096
+
+def load_script(script: ScriptExecution) -> Dict:
+    """Record a run's args and return its saved script, raising 404 if there is none"""
+    logger.debug("Executing script: %s", script.name)
+    logger.debug("Script args: %s", script.args)
+    logger.debug("Script working dir: %s", script.working_dir)
+    # Save the arguments if provided
+    if script.args:
+        database.save_script_args(script.name, script.args, script.working_dir)
+
+    # Get the script body from the database
+    db_script = database.get_script_by_name(script.name)
+    if not db_script:
+        raise HTTPException(status_code=404, detail="Script not found")
+    return db_script
+
+async def start_script_process(script: ScriptExecution, db_script: Dict, stderr=subprocess.PIPE):
+    """Start a script returned by load_script() with stdout piped"""
+    script.body = db_script['body']  # Use the body from the database
+    logger.debug("Script body from DB: %.100s...", script.body)
+
+    # Determine if this is a Python script
+    is_python = _is_python(script.body, script.name.endswith('.py'))
+    logger.debug("Is Python script: %s", is_python)
+
+    # Pass the body directly where possible; only bodies too long for argv go through a file
+    script_file = None
+    if is_python:
+        cmd = ["/usr/bin/python3", "-"]  # python3 reads the program from stdin
+    elif len(script.body.encode()) < MAX_ARG_STRLEN:
+        cmd = ["/bin/bash", "-c", script.body, script.name]  # $0 is the script name
+    else:
+        # Too long for a single argv string (exec fails with E2BIG). Hand bash an
+        # already-unlinked temp file through an inherited descriptor instead;
+        # stdin is left alone so commands in the script can still read it
+        script_file = tempfile.TemporaryFile()
+        script_file.write(script.body.encode())
+        script_file.flush()
+        # Sourced from a -c stub so $0 is the script name here too, as on the path above
+        cmd = ["/bin/bash", "-c", f'. "/dev/fd/{script_file.fileno()}" "$@"', script.name]
+
+    if script.args:
+        cmd.extend(shlex.split(script.args))
+
+    if db_script["accepts_reference"]:
+        cmd.append("--reference")
+        cmd.append(exec_env.get_reference())
+
+    logger.debug("Executing command: %s", ' '.join(cmd))
+
+    # Start the process
+    if not script.working_dir:
+        script.working_dir = os.getcwd()
     try:
-        print(f"Executing script: {script.name}")  # Debug print
-        print(f"Script args: {script.args}")  # Debug print
-        print(f"Script working dir: {script.working_dir}")  # Debug print
-        # Save the arguments if provided
-        if script.args:
-            database.save_script_args(script.name, script.args, script.working_dir)
-
-        # Get the script body from the database
-        db_script = database.get_script_by_name(script.name)
-        if not db_script:
-            raise HTTPException(status_code=404, detail="Script not found")
-        
-        script.body = db_script['body']  # Use the body from the database
-        print(f"Script body from DB: {script.body[:100]}...")  # Debug print (first 100 chars)
-
-        # Create a temporary script file
-        script_path = f"/tmp/script_{script.name}.sh"
-        print(f"Creating script file: {script_path}")  # Debug print
-        
-        # Determine if this is a Python script
-        is_python = (
-            script.name.endswith('.py') or
-            script.body.strip().startswith('#!/usr/bin/env python') or
-            script.body.strip().startswith('#!/usr/bin/python') or
-            script.body.strip().startswith('import ') or
-            script.body.strip().startswith('from ')
+        process = await anyio.open_process(
+            cmd,
+            stdin=subprocess.PIPE if is_python else None,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            cwd=script.working_dir,
+            pass_fds=(script_file.fileno(),) if script_file else (),
+            start_new_session=True,  # own process group, so whatever it starts can be signalled too
         )
-        print(f"Is Python script: {is_python}")  # Debug print
-        
-        try:
-            with open(script_path, 'w') as f:
-                if is_python:
-                    # For Python scripts, write the content as is
-                    f.write(script.body)
-                    # Add .py extension to the file
-                    os.rename(script_path, script_path + '.py')
-                    script_path += '.py'
-                else:
-                    # For shell scripts, add shebang
-                    f.write("#!/bin/bash\n")
-                    f.write(script.body)
-            print(f"Script file created successfully")  # Debug print
-        except Exception as e:
-            print(f"Error creating script file: {str(e)}")  # Debug print
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to create script file: {str(e)}"
-            )
-        
-        # Make the script executable
+    finally:
+        # The child holds its own copy of the descriptor
+        if script_file is not None:
+            script_file.close()
+
+    if process.stdin is not None:
+        # Python reads the whole program before running it, so send it all up front
         try:
-            os.chmod(script_path, 0o755)
-            print(f"Script file permissions set to 755")  # Debug print
-        except Exception as e:
-            print(f"Error setting script permissions: {str(e)}")  # Debug print
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to set script permissions: {str(e)}"
-            )
-        
-        # Verify the file exists and is executable
-        if not os.path.exists(script_path):
-            raise HTTPException(
-                status_code=500,
-                detail=f"Script file was not created: {script_path}"
-            )
-        
-        if not os.access(script_path, os.X_OK):
-            raise HTTPException(
-                status_code=500,
-                detail=f"Script file is not executable: {script_path}"
-            )
-        
-        # Execute the script with arguments
-        if is_python:
-            cmd = ["/usr/bin/python3", script_path]  # Use python3 for Python scripts
-        else:
-            cmd = ["/bin/bash", script_path]  # Use bash for shell scripts
-            
-        if script.args:
-            cmd.extend(shlex.split(script.args))
+            await process.stdin.send(script.body.encode())
+            await process.stdin.aclose()
+        except BaseException:
+            signal_script_process(process, signal.SIGKILL)
+            await process.aclose()
+            raise
 
-        if db_script["accepts_reference"]:
-            cmd.append("--reference")
-            encoded = json.dumps(exec_env.get_json()).encode("utf-8").hex()
-            cmd.append(encoded)
+    return process
 
-        print(f"Executing command: {' '.join(cmd)}")  # Debug print
-        
-        # Start the process
-        if not script.working_dir:
-            script.working_dir = os.getcwd()
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=script.working_dir,
-        )
+def signal_script_process(process, sig: int):
+    """Send *sig* to a script run's whole process group, not just the interpreter"""
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
 
-        # Create a queue for output
-        output_queue = asyncio.Queue()
+@app.post("/api/fs/execute-script-stream")
+async def execute_script_stream(script: ScriptExecution, request: Request):
+    try:
+        # Create a stream for output; the script runs to completion before the
+        # response starts, so the buffer must hold all of its output
+        send_stream, receive_stream = anyio.create_memory_object_stream(math.inf)
 
         # the output from a command would be a bunch of text, ended by EOF or string --JSON--
         # optionally this is followed by a json string until EOF
 
         async def stream_process_output():
-            stdout_remainder = ""
-            stderr_remainder = ""
             yaml_started = False
-            yaml_buffer = ""
-            text_buffer = ""
-
-            try:
+            # Collected as chunk lists and joined once at the end
+            yaml_chunks = []
+            text_chunks = []
+
+            async def read_text(stream):
+                # Decode each chunk once and yield it up to its last newline; the
+                # incremental decoder holds back a code point split across chunks
+                # and a trailing partial line waits for the next chunk
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                remainder = ""
+                async for chunk in stream:
+                    text = remainder + decoder.decode(chunk)
+                    end = text.rfind("\n") + 1
+                    remainder = text[end:]
+                    if end:
+                        yield text[:end]
+                remainder += decoder.decode(b"", final=True)
+                if remainder:
+                    yield remainder
+
+            # Checked once per run so per-line logging costs nothing when DEBUG is off
+            log_lines = logger.isEnabledFor(logging.DEBUG)
+
+            async def pump(stream, tag):
+                # Works on whole blocks of lines: one marker search per read
+                # rather than a check and a send for every line
+                nonlocal yaml_started
+                async for text in read_text(stream):
+                    if tag == "error":
+                        if log_lines:
+                            for line in text.splitlines():
+                                logger.debug("STDERR: %s", line.strip())
+                        await send_stream.send(("error", text))
+                        continue
+                    if yaml_started:
+                        yaml_chunks.append(text)
+                        continue
+                    marker = text.find("--YAML--")
+                    if marker != -1:
+                        # Lines before the marker's line are still output; the
+                        # rest of the marker's line onwards is YAML
+                        yaml_started = True
+                        yaml_chunks.append(text[marker + len("--YAML--"):])
+                        text = text[:text.rfind("\n", 0, marker) + 1]
+                        if not text:
+                            continue
+                    if log_lines:
+                        for line in text.splitlines():
+                            logger.debug("STDOUT: %s", line.strip())
+                    await send_stream.send(("output", text))
+                    text_chunks.append(text)
+
+            async def watch_disconnect():
+                # Blocks until the server reports the client has gone away
                 while True:
-                    if await request.is_disconnected():
-                        print("Client disconnected, terminating process")
-                        process.terminate()
-                        break
-
-                    stdout_data = await process.stdout.read(1024)
-                    if stdout_data:
-                        decoded = stdout_data.decode()
-                        combined = stdout_remainder + decoded
-                        lines = combined.splitlines(keepends=True)
-
-                        if lines and not lines[-1].endswith('\n'):
-                            stdout_remainder = lines.pop()
-                        else:
-                            stdout_remainder = ""
-
-                        for line in lines:
-                            if yaml_started:
-                                yaml_buffer += line
-                            elif "--YAML--" in line:
-                                yaml_started = True
-                                _, after_marker = line.split("--YAML--", 1)
-                                yaml_buffer += after_marker
-                            else:
-                                print(f"STDOUT: {line.strip()}")
-                                await output_queue.put(("output", line))
-                                text_buffer += line
-
-                    stderr_data = await process.stderr.read(1024)
-                    if stderr_data:
-                        decoded = stderr_data.decode()
-                        combined = stderr_remainder + decoded
-                        lines = combined.splitlines(keepends=True)
-
-                        if lines and not lines[-1].endswith('\n'):
-                            stderr_remainder = lines.pop()
-                        else:
-                            stderr_remainder = ""
-
-                        for line in lines:
-                            print(f"STDERR: {line.strip()}")
-                            await output_queue.put(("error", line))
-
-                    if process.stdout.at_eof() and process.stderr.at_eof():
-                        return_code = await process.wait()
-                        print(f"Process exited with code: {return_code}")
-
-                        if stdout_remainder:
-                            if yaml_started:
-                                yaml_buffer += stdout_remainder
-                            else:
-                                print(f"STDOUT (incomplete): {stdout_remainder.strip()}")
-                                await output_queue.put(("output", stdout_remainder))
-                                text_buffer += stdout_remainder
+                    message = await request.receive()
+                    if message["type"] == "http.disconnect":
+                        logger.info("Client disconnected, terminating process")
+                        signal_script_process(process, signal.SIGTERM)
+                        return
 
-                        if stderr_remainder:
-                            print(f"STDERR (incomplete): {stderr_remainder.strip()}")
-                            await output_queue.put(("error", stderr_remainder))
-
-                        if return_code != 0:
-                            await output_queue.put(("error", f"Process exited with code {return_code}"))
+            try:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(watch_disconnect)
+                    async with anyio.create_task_group() as readers:
+                        readers.start_soon(pump, process.stdout, "output")
+                        readers.start_soon(pump, process.stderr, "error")
+                    # Both pipes hit EOF; stop waiting for a disconnect
+                    tg.cancel_scope.cancel()
 
-                        break
+                return_code = await process.wait()
+                logger.debug("Process exited with code: %s", return_code)
 
-                    await asyncio.sleep(0.1)
+                if return_code != 0:
+                    await send_stream.send(("error", f"Process exited with code {return_code}"))
 
             except Exception as e:
-                print(f"Error in stream_process_output: {e}")
-                await output_queue.put(("error", f"Error: {str(e)}"))
+                logger.error("Error in stream_process_output: %s", e)
+                await send_stream.send(("error", f"Error: {str(e)}"))
 
             finally:
-                try:
-                    os.remove(script_path)
-                    print(f"Cleaned up script file: {script_path}")
-                except Exception as e:
-                    print(f"Error removing script file: {e}")
+                if process.returncode is None:
+                    signal_script_process(process, signal.SIGKILL)
+                await process.aclose()
+                send_stream.close()
 
-            # Parse and return JSON if present
+            # Return the YAML section too if the script produced one
+            text_buffer = "".join(text_chunks)
             if yaml_started:
-                try:
-                    return (text_buffer, yaml_buffer)
-                except json.JSONDecodeError as e:
-                    print(f"Failed to parse JSON: {e}")
-                    await output_queue.put(("error", "Invalid JSON received"))
-                    return (text_buffer, None)
-            else:
-                return (text_buffer, None)
-
-        # Start the output streaming task
-        stream_task = asyncio.create_task(stream_process_output())
-        (text_result, yaml_result) = await stream_task
+                return (text_buffer, "".join(yaml_chunks))
+            return (text_buffer, None)
+
+        db_script = load_script(script)
+        # Runs beyond the concurrency limit wait here until a slot frees up
+        async with get_script_limiter():
+            process = await start_script_process(script, db_script)
+            (text_result, yaml_result) = await stream_process_output()
         if yaml_result is not None:
             command_result = ExecResult(
                 type="json",
                 command=script.name,
-                json_result=yaml.safe_load(yaml_result),
+                json_result=yaml.load(yaml_result, Loader=YamlLoader),
                 text_result=text_result,
                 args=script.args
             )
             exec_env.add_result(command_result)
         async def event_generator():
             try:
+                pending = None
                 while True:
-                    # Check if client disconnected
-                    if await request.is_disconnected():
-                        print("Client disconnected in event_generator")
-                        break
-
-                    try:
-                        # Get message from queue with timeout
-                        event_type, data = await asyncio.wait_for(output_queue.get(), timeout=0.1)
-                        print(f"Sending event: {event_type} - {data[:100]}...")  # Debug print
-                        
-                        # Format the data for SSE
-                        formatted_data = data.replace('\n', '\\n')
-                        yield f"event: {event_type}\ndata: {formatted_data}\n\n"
-                        
-                        # Mark task as done
-                        output_queue.task_done()
-                    except asyncio.TimeoutError:
-                        # No data available, check if streaming task has finished
-                        if stream_task.done() and output_queue.empty():
+                    if pending is not None:
+                        event_type, data = pending
+                        pending = None
+                    else:
+                        try:
+                            event_type, data = await receive_stream.receive()
+                        except anyio.EndOfStream:
                             break
-                        continue
-                    except Exception as e:
-                        print(f"Error in event_generator: {e}")  # Debug print
-                        yield f"event: error\ndata: Error: {str(e)}\n\n"
-                        break
+
+                    # Coalesce queued lines of the same type into one frame of up to 16 KB
+                    chunks = [data]
+                    size = len(data)
+                    while size < 16384:
+                        try:
+                            next_type, more = receive_stream.receive_nowait()
+                        except (anyio.WouldBlock, anyio.EndOfStream):
+                            break
+                        if next_type != event_type:
+                            pending = (next_type, more)
+                            break
+                        chunks.append(more)
+                        size += len(more)
+                    data = "".join(chunks)
+                    logger.debug("Sending event: %s - %.100s...", event_type, data)
+
+                    yield _build_sse_frame(event_type, data)
 
                 # Send final event
-                print("Sending final event")  # Debug print
-                yield "event: done\ndata: Script execution completed\n\n"
+                logger.debug("Sending final event")
+                yield SSE_DONE_FRAME
             except Exception as e:
-                print(f"Error in event_generator: {e}")  # Debug print
-                yield f"event: error\ndata: Error: {str(e)}\n\n"
-            finally:
-                # Cancel the stream task if it's still running
-                if not stream_task.done():
-                    stream_task.cancel()
-                    try:
-                        await stream_task
-                    except asyncio.CancelledError:
-                        pass
+                logger.error("Error in event_generator: %s", e)
+                yield _build_sse_frame("error", f"Error: {str(e)}")
 
         return StreamingResponse(
             event_generator(),
@@ -933,10 +992,80 @@ async def execute_script_stream(script: ScriptExecution, request: Request):
                 "X-Accel-Buffering": "no"
             }
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in execute_script_stream: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/fs/script-concurrency")
+async def get_script_concurrency():
+    limiter = get_script_limiter()
+    return {"limit": limiter.total_tokens, "running": limiter.borrowed_tokens}
+
+@app.post("/api/fs/script-concurrency")
+async def set_script_concurrency(request: ScriptConcurrency):
+    if request.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    # Raising the limit wakes waiting runs; lowering it lets running ones finish
+    limiter = get_script_limiter()
+    limiter.total_tokens = request.limit
+    return {"status": "success", "limit": limiter.total_tokens}
+
+@app.post("/api/fs/execute-script-raw")
+async def execute_script_raw(script: ScriptExecution):
+    """Stream a script's combined stdout and stderr as plain bytes, without SSE framing"""
+    # Looked up before the response starts so a missing script is still a 404
+    try:
+        db_script = load_script(script)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in execute_script_stream: {e}")  # Debug print
+        logger.error("Error in execute_script_raw: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def byte_generator():
+        # The process starts only once streaming does, so a client that leaves
+        # before then never gets one. The slot is held on behalf of this
+        # generator rather than the current task: if the server abandons the
+        # generator at a yield, its finally later runs from another task
+        limiter = get_script_limiter()
+        slot = object()
+        await limiter.acquire_on_behalf_of(slot)
+        process = None
+        completed = False
+        try:
+            try:
+                process = await start_script_process(script, db_script, stderr=subprocess.STDOUT)
+            except Exception as e:
+                logger.error("Error in execute_script_raw: %s", e)
+                yield f"Error: {e}\n".encode()
+                return
+            # Chunks go out as read; no decoding, line splitting or escaping
+            async for chunk in process.stdout:
+                yield chunk
+            completed = True
+        finally:
+            try:
+                if process is not None:
+                    # Only kill when the client went away mid-stream; signalling after EOF
+                    # can reap the child before asyncio's watcher sees it exit
+                    if not completed and process.returncode is None:
+                        signal_script_process(process, signal.SIGKILL)
+                    await process.aclose()
+            finally:
+                limiter.release_on_behalf_of(slot)
+
+    return StreamingResponse(
+        byte_generator(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 if __name__ == "__main__":
     import uvicorn
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING").upper())
     uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
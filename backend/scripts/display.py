@@ -1,9 +1,20 @@
 import argparse
-import json
 import sys
 import os
+import re
+
+# Runs under whatever python3 is on PATH, so orjson is only a fast path
+try:
+    from orjson import loads as _json_loads  # accepts bytes directly
+except ImportError:
+    import json
+
+    def _json_loads(data):
+        return json.loads(data.decode("utf-8"))
 from backend.imviewer import start_image_viewer
 
+_PART_RE = re.compile(r'(\d+)\s*(?:-\s*(\d+))?')
+
 def display_image(base_dir, rel_paths):
     try:
         start_image_viewer(base_dir, rel_paths)
@@ -12,21 +23,32 @@ def display_image(base_dir, rel_paths):
 
 def decode_reference(hex_str):
     try:
-        json_str = bytes.fromhex(hex_str).decode("utf-8")
-        return json.loads(json_str)
+        return _json_loads(bytes.fromhex(hex_str))
     except Exception as e:
         print(f"Error decoding --reference: {e}")
         sys.exit(1)
 def parse_number_arg(number_arg):
-    result = set()
+    """Turn a 1-based spec like "1-3,7" into sorted, de-duplicated 0-based indexes.
+
+    Ranges are merged as (start, end) spans rather than expanded into a set,
+    so a spec like "1-100000" never hashes or re-sorts every index."""
+    spans = []
     for part in number_arg.split(','):
-        part = part.strip()
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            result.update(range(start - 1, end))  # convert to 0-based
-        else:
-            result.add(int(part) - 1)
-    return sorted(result)
+        m = _PART_RE.fullmatch(part.strip())
+        if m is None:
+            raise ValueError(f"Invalid number: {part.strip()!r}")
+        start, end = m.groups()
+        spans.append((int(start) - 1, int(end or start)))
+    spans.sort()
+    result = []
+    covered = None  # exclusive end of the indexes emitted so far
+    for start, end in spans:
+        if covered is not None:
+            start = max(start, covered)
+        if start < end:
+            result.extend(range(start, end))
+            covered = end
+    return result
 
 def main():
     parser = argparse.ArgumentParser(description="Display an image from file or reference data.")
@@ -74,22 +96,20 @@ def main():
         common_root = os.path.commonpath(full_paths)
 #        print(f"Common root: {common_root}")
 
-        # Step 3: Update each dict with the relative path
+        # Step 3: Update each dict with the relative path.  Paths under
+        # common_root just lose that prefix; anything else (e.g. the root
+        # itself when only one path is selected) goes through relpath.
+        prefix = os.path.join(common_root, "")
+        prefix_len = len(prefix)
         for item in to_display:
-            item["name"] = os.path.relpath(item["path"], common_root)
+            path = item["path"]
+            if path.startswith(prefix):
+                item["name"] = path[prefix_len:]
+            else:
+                item["name"] = os.path.relpath(path, common_root)
 
         relative_paths = [x["name"] for x in to_display]
 
-        if index < 0 or index >= len(records):
-            print(f"Error: Index {args.number} out of range.")
-            sys.exit(1)
-
-
-        record = records[index]
-        if "name" not in record:
-            print(f"Error: Record at index {args.number} does not contain 'name' field.")
-            sys.exit(1)
-
         display_image(common_root, relative_paths)
     else:
         print("Error: Either --file or --reference must be provided.")
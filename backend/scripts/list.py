@@ -25,40 +25,81 @@ Defaults:
 """
 
 import argparse
+import os
+import re
 from pathlib import Path
-from datetime import datetime, timedelta
-from tabulate import tabulate
-import textwrap
+from datetime import datetime, timedelta, timezone
 import fnmatch
+from operator import attrgetter
+import sys
+import time
+from typing import NamedTuple
 import yaml
 
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
 
-def get_file_info(path: Path, root: Path, depth: int):
-    stat = path.lstat()
-    if path.is_symlink():
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %Z"
+SECONDS_PER_DAY = 86400
+
+# Sort on the raw stat values; "date" compares st_mtime floats rather than
+# datetime objects, which are only built for the rows that get printed.
+SORT_KEYS = {
+    "name": attrgetter("name"),
+    "size": attrgetter("size"),
+    "date": attrgetter("mtime"),
+}
+
+# timezone objects keyed by UTC offset; typically one or two entries (DST).
+_local_tz = {}
+
+
+def local_datetime(timestamp):
+    """Return timestamp as an aware local datetime.
+
+    Same result as datetime.fromtimestamp(timestamp).astimezone(), but the
+    timezone object for each UTC offset is built once and reused.
+    """
+    lt = time.localtime(timestamp)
+    tz = _local_tz.get(lt.tm_gmtoff)
+    if tz is None:
+        tz = _local_tz[lt.tm_gmtoff] = timezone(timedelta(seconds=lt.tm_gmtoff), lt.tm_zone)
+    return datetime.fromtimestamp(timestamp, tz)
+
+
+class FileInfo(NamedTuple):
+    """One listed entry; a tuple is cheaper to build per file than a dict."""
+    name: str
+    type: str
+    size: int
+    mtime: float
+    depth: int
+    path: str
+
+
+def get_file_info(entry: os.DirEntry, prefix_len: int, depth: int):
+    stat = entry.stat(follow_symlinks=False)
+    if entry.is_symlink():
         ftype = "L"
-    elif path.is_dir():
+    elif entry.is_dir(follow_symlinks=False):
         ftype = "D"
     else:
         ftype = "F"
 
-    rel_path = path.relative_to(root)
-    parts = rel_path.parts
+    # entry.path is always root joined with the relative path, so slicing
+    # off the root prefix is enough; no need for relative_to()/relpath().
+    rel_path = entry.path[prefix_len:]
 
-    if depth > 1 and len(parts) > 1:
-        prefix = "/".join(parts[:-1])
-        name = f"{prefix}/{parts[-1]}"
-    else:
-        name = parts[-1]
-
-    return {
-        "name": name,
-        "type": ftype,
-        "size": stat.st_size,
-        "date": datetime.fromtimestamp(stat.st_mtime).astimezone(),
-        "depth": len(parts),
-        "path": path
-    }
+    return FileInfo(
+        rel_path if depth > 1 else entry.name,
+        ftype,
+        stat.st_size,
+        stat.st_mtime,
+        rel_path.count(os.sep) + 1,
+        entry.path,
+    )
 
 
 def human_readable_size(size_bytes):
@@ -75,20 +116,60 @@ def human_readable_size(size_bytes):
 
 
 def wrap_and_indent(text, width=30, indent="- "):
-    lines = textwrap.wrap(text, width=width)
+    if len(text) <= width:
+        return [text]
+    lines = [text[i:i + width] for i in range(0, len(text), width)]
     return [lines[0]] + [f"{indent}{line}" for line in lines[1:]]
 
 
-def gather_files(root: Path, max_depth: int):
+def write_table(rows, headers, right_align, out=None):
+    """Write rows as a GitHub-style pipe table.
+
+    Columns are padded to their widest cell (and at least two wider than the
+    header, as tabulate did); right_align lists the columns holding numbers.
+    """
+    # Looked up per call so a redirected sys.stdout is honoured
+    out = out or sys.stdout
+    widths = [len(h) + 2 for h in headers]
+    for row in rows:
+        for i, cell in enumerate(row):
+            if len(cell) > widths[i]:
+                widths[i] = len(cell)
+    if not rows:
+        right_align = ()
+    row_fmt = "| " + " | ".join(
+        f"{{:{'>' if i in right_align else '<'}{w}}}" for i, w in enumerate(widths)
+    ) + " |\n"
+    out.write(row_fmt.format(*headers))
+    out.write("|" + "|".join("-" * (w + 2) for w in widths) + "|\n")
+    out.writelines(row_fmt.format(*row) for row in rows)
+
+
+def gather_files(root: str, max_depth: int):
+    """Collect DirEntry objects under root, at most max_depth levels deep.
+
+    Each directory's entries are listed before descending into its
+    subdirectories, matching the order rglob() used to produce.  Symlinked
+    directories are not followed and subtrees below max_depth are never
+    opened.
+    """
     results = []
-    for path in root.rglob("*"):
+
+    def walk(path, depth):
         try:
-            rel = path.relative_to(root)
-        except ValueError:
-            continue
-        depth = len(rel.parts)
-        if depth <= max_depth:
-            results.append(path)
+            it = os.scandir(path)
+        except OSError:
+            return
+        subdirs = []
+        with it:
+            for entry in it:
+                results.append(entry)
+                if depth < max_depth and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+        for sub in subdirs:
+            walk(sub, depth + 1)
+
+    walk(root, 1)
     return results
 
 
@@ -125,54 +206,58 @@ def main():
         print(f"Error: '{folder_path}' is not a valid directory.")
         return
 
+    root = str(folder_path)
     if args.depth == 1:
-        entries = list(folder_path.iterdir())
+        with os.scandir(root) as it:
+            entries = list(it)
     else:
-        entries = gather_files(folder_path, args.depth)
+        entries = gather_files(root, args.depth)
 
-    files_info = [get_file_info(f, folder_path, args.depth) for f in entries]
+    prefix_len = len(os.path.join(root, ""))
+    files_info = [get_file_info(f, prefix_len, args.depth) for f in entries]
 
     # Apply filters
     if args.name:
-        files_info = [f for f in files_info if fnmatch.fnmatch(f["name"], args.name)]
+        match_name = re.compile(fnmatch.translate(args.name)).match
+        files_info = [f for f in files_info if match_name(f.name)]
 
     min_size, max_size = parse_size_range(args.size)
     if min_size is not None:
-        files_info = [f for f in files_info if f["size"] >= min_size]
+        files_info = [f for f in files_info if f.size >= min_size]
     if max_size is not None:
-        files_info = [f for f in files_info if f["size"] <= max_size]
+        files_info = [f for f in files_info if f.size <= max_size]
 
     min_days, max_days = parse_mtime_range(args.mtime)
-    now = datetime.now().astimezone()
+    now = time.time()
     if min_days is not None:
-        min_time = now - timedelta(days=min_days)
-        files_info = [f for f in files_info if f["date"] >= min_time]
+        min_time = now - min_days * SECONDS_PER_DAY
+        files_info = [f for f in files_info if f.mtime >= min_time]
     if max_days is not None:
-        max_time = now - timedelta(days=max_days)
-        files_info = [f for f in files_info if f["date"] <= max_time]
+        max_time = now - max_days * SECONDS_PER_DAY
+        files_info = [f for f in files_info if f.mtime <= max_time]
 
     if args.newer:
         newer_path = Path(args.newer)
         if newer_path.exists():
-            threshold = datetime.fromtimestamp(newer_path.stat().st_mtime).astimezone()
-            files_info = [f for f in files_info if f["date"] > threshold]
+            threshold = newer_path.stat().st_mtime
+            files_info = [f for f in files_info if f.mtime > threshold]
 
     if args.sort_by:
         reverse = args.order == "desc"
-        files_info.sort(key=lambda x: x[args.sort_by], reverse=reverse)
+        files_info.sort(key=SORT_KEYS[args.sort_by], reverse=reverse)
 
     rows = []
     yaml_list = []
     for i, f in enumerate(files_info, start=1):
-        name_lines = wrap_and_indent(f["name"])
-        type_str = f["type"]
+        name_lines = wrap_and_indent(f.name)
+        type_str = f.type
         size_str = (
-            human_readable_size(f["size"])
+            human_readable_size(f.size)
             if args.human
-            else str(int(f["size"]))
+            else str(int(f.size))
         )
 
-        date_str = f["date"].strftime("%Y-%m-%d %H:%M:%S %Z")
+        date_str = local_datetime(f.mtime).strftime(DATE_FORMAT)
 
         max_lines = len(name_lines)
         row = [
@@ -185,26 +270,28 @@ def main():
         rows.extend(zip(*row))
 
         yaml_list.append({
-            "path": str(f["path"]),
-            "name": f["name"],
+            "path": f.path,
+            "name": f.name,
             "type": type_str,
             "size": size_str,
             "date": date_str,
         })
 
-    print(tabulate(
+    write_table(
         rows,
         headers=["S.No", "Name", "T", "Size", "Modified Date"],
-        tablefmt="github",
-        stralign="left"
-    ))
+        right_align=(0,) if args.human else (0, 3),
+    )
 
-    print("\n--YAML--")
+    sys.stdout.write("\n--YAML--\n")
     yaml_output = {
         "directory": str(folder_path),
         "files": yaml_list
     }
-    print(yaml.dump(yaml_output, sort_keys=False))
+    # Emit straight into stdout instead of building the whole document as
+    # one string first; the libyaml dumper is used when it is available.
+    yaml.dump(yaml_output, sys.stdout, Dumper=YamlDumper, sort_keys=False)
+    sys.stdout.write("\n")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,21 @@
 # tests/conftest.py
 
+import sys
+from pathlib import Path
+
 import pytest
 from fastapi.testclient import TestClient
+
+# backend/main.py uses flat imports ("import database"), so backend/ itself
+# has to be importable before the app is loaded
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
 from backend.main import app  # Adjust the import based on your app's location
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def client():
-    """Provides a TestClient instance."""
-    return TestClient(app)
+    """Provides a TestClient instance shared by the whole test session.
+
+    Entered as a context manager so the app's lifespan (database setup) runs."""
+    with TestClient(app) as c:
+        yield c
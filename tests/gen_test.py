@@ -1,37 +1,47 @@
-import os
 import sqlite3
-import tempfile
-from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
 
-# Import the FastAPI app and the database module we need to monkey-patch
+# Import the FastAPI app and the database module we need to monkey-patch.
+# Patch the module main itself imported: backend.database would be a second,
+# separate copy that the endpoints never use.
 from backend import main as backend_main
-from backend import database as db
+db = backend_main.database
 
 
-def _make_test_connection(db_file: Path):
-    """Return a fresh connection to the temporary database file."""
-    conn = sqlite3.connect(db_file)
+# A named in-memory database shared by every connection in this process; it
+# lives as long as at least one connection to it stays open.
+TEST_DB_URI = "file:scripts_test?mode=memory&cache=shared"
+
+
+def _make_test_connection():
+    """Return a new connection to the shared in-memory test database."""
+    conn = sqlite3.connect(TEST_DB_URI, uri=True, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
     return conn
 
 
 @pytest.fixture(scope="session")
-def client(tmp_path_factory, monkeypatch):
-    """Spin up TestClient with an isolated SQLite database."""
-    tmp_dir = tmp_path_factory.mktemp("data")
-    test_db_path = tmp_dir / "scripts_test.db"
+def client():
+    """Spin up TestClient with an isolated in-memory SQLite database."""
+    # Held open for the whole session so the in-memory database isn't dropped
+    keepalive = _make_test_connection()
 
-    # Monkey-patch the get_db_connection function to use our temp file
-    monkeypatch.setattr(db, "get_db_connection", lambda: _make_test_connection(test_db_path))
+    # monkeypatch is function-scoped, so use a MonkeyPatch context directly
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "get_db_connection", _make_test_connection)
 
-    # Re-initialise the schema in the new database file
-    db.init_db()
+        # Initialise the schema in the in-memory database
+        db.init_db()
 
-    with TestClient(backend_main.app) as c:
-        yield c
+        with TestClient(backend_main.app) as c:
+            yield c
+
+        db.close_connection()
+    keepalive.close()
 
 
 SCRIPT_PAYLOAD = {
@@ -71,6 +81,17 @@ def test_get_single_script(client):
     assert script["description"] == SCRIPT_PAYLOAD["description"]
 
 
+def test_execute_script_raw_releases_its_slot(client):
+    r = client.post("/api/fs/execute-script-raw", json={"name": SCRIPT_PAYLOAD["name"]})
+    assert r.status_code == 200
+    assert r.text == "Hello World\n"
+    # The run holds a slot from the same limiter as the streaming endpoint
+    assert client.get("/api/fs/script-concurrency").json()["running"] == 0
+
+    r_missing = client.post("/api/fs/execute-script-raw", json={"name": "No Such Script"})
+    assert r_missing.status_code == 404
+
+
 def test_script_args_flow(client):
     # Initially there should be no args
     r = client.get(f"/api/fs/scripts/{SCRIPT_PAYLOAD['name']}/args")
@@ -84,9 +105,31 @@ def test_script_args_flow(client):
     r2 = client.get(f"/api/fs/scripts/{SCRIPT_PAYLOAD['name']}/args")
     assert r2.status_code == 200
     history = r2.json()["args"]
-    # Latest first
-    assert history[0] == "--bar 2"
-    assert "--foo 1" in history
+    # Latest first; each entry carries its args and working_dir
+    assert history[0]["args"] == "--bar 2"
+    assert "--foo 1" in [h["args"] for h in history]
+
+
+def test_script_args_history_is_trimmed(client):
+    for i in range(15):
+        db.save_script_args(SCRIPT_PAYLOAD["name"], f"--n {i}")
+
+    # Count what is stored, not what get_script_args returns: it has its own LIMIT
+    conn = _make_test_connection()
+    try:
+        col = db.get_arg_column(conn)
+        ref_expr = "id" if col == "script_id" else "name"
+        stored = [row["args"] for row in conn.execute(
+            f"SELECT args FROM script_args"
+            f" WHERE {col} = (SELECT {ref_expr} FROM scripts WHERE name = ?)",
+            (SCRIPT_PAYLOAD["name"],))]
+    finally:
+        conn.close()
+    assert len(stored) == 10
+    assert sorted(stored) == sorted(f"--n {i}" for i in range(5, 15))
+
+    history = db.get_script_args(SCRIPT_PAYLOAD["name"])
+    assert history[0]["args"] == "--n 14"
 
 
 def test_rename_script(client):